@@ -1,10 +1,22 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, status, Body
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    UploadFile,
+    File,
+    Form,
+    status,
+    Body,
+    Request,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
 from typing import Optional, Dict, Any
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+import asyncio
 import logging
+import os
 from models.request_models import AnalysisRequest
 from services.analysis_service import AnalysisService
 
@@ -19,7 +31,40 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Sales Assistant API", version="1.0.0")
+# Initialize services
+analysis_service = AnalysisService()
+
+# Cap in-flight analyses per worker; each one holds open LLM calls
+max_concurrent_analyses = int(os.getenv("MAX_CONCURRENT_ANALYSES", "32"))
+analysis_semaphore = asyncio.Semaphore(max_concurrent_analyses)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release scraper resources once in-flight requests have drained"""
+    yield
+    await analysis_service.scraper_service.close()
+
+
+app = FastAPI(title="Sales Assistant API", version="1.0.0", lifespan=lifespan)
+
+
+# Registered before CORS so shed responses still carry CORS headers
+@app.middleware("http")
+async def shed_analysis_load(request: Request, call_next):
+    """Reject analysis requests with 503 when this worker is at capacity"""
+    if request.url.path != "/api/analyze":
+        return await call_next(request)
+    if analysis_semaphore.locked():
+        logger.warning("Analysis capacity reached, shedding request")
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Server is busy, please retry shortly"},
+            headers={"Retry-After": "5"},
+        )
+    async with analysis_semaphore:
+        return await call_next(request)
+
 
 # Configure CORS
 app.add_middleware(
@@ -30,9 +75,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-analysis_service = AnalysisService()
-
 
 @app.get("/health")
 async def health_check():
@@ -1,4 +1,67 @@
+import os
+import argparse
+import logging
+from importlib.util import find_spec
 import uvicorn
+from dotenv import load_dotenv
 
-if __name__ == "__main__":
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on, which respects container CPU sets"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def run_production():
+    """Run multiple workers with tuned networking and graceful drain"""
+    loop = "uvloop" if find_spec("uvloop") else "asyncio"
+    http = "httptools" if find_spec("httptools") else "h11"
+    # Unset or blank means one worker per available core
+    workers = int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+
+    logger.info(f"Starting {workers} workers (loop={loop}, http={http})")
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=int(os.getenv("BACKLOG", "2048")),
+        # Keep idle connections open longer than the load balancer does
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "75")),
+        # Per-worker ceiling on open connections, idle keep-alives included.
+        # Analysis load shedding happens in main.py (MAX_CONCURRENT_ANALYSES).
+        limit_concurrency=int(os.getenv("LIMIT_CONCURRENCY", "1000")),
+        # On SIGTERM stop accepting and let in-flight LLM calls finish
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "60")),
+        proxy_headers=True,
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+    )
+
+
+def run_development():
+    """Run a single auto-reloading process"""
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Sales Assistant API")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        default=os.getenv("ENV") == "production",
+        help="Run the multi-worker production server (default when ENV=production)",
+    )
+    args = parser.parse_args()
+
+    if args.production:
+        run_production()
+    else:
+        run_development()
@@ -1,6 +1,8 @@
 from typing import Dict, Any, Optional
+import asyncio
 from .llm_service import LLMService
 from .scraper_service import ScraperService
+from .similarity_service import SimilarityService
 from models.company import Company
 from models.product import Product
 from models.analysis import Analysis
@@ -11,6 +13,7 @@ class AnalysisService:
     def __init__(self):
         self.llm_service = LLMService()
         self.scraper_service = ScraperService()
+        self.similarity_service = SimilarityService()
 
     async def analyze_sales_opportunity(
         self, company: Company, product: Product
@@ -18,11 +21,44 @@ class AnalysisService:
         """
         Analyze sales opportunity for a given company and product
         """
-        company_data = await self.scraper_service.scrape_company_info(company.website)
-        company_analysis = await self.llm_service.analyze_company(company_data)
-        sales_strategy = await self.llm_service.generate_sales_strategy(
-            company_analysis, product.dict()
+        company_url = str(company.website)
+        company_data = await self.scraper_service.scrape_company_info(company_url)
+        company_text = self.similarity_service.company_text(company_data)
+        product_data = product.dict()
+
+        # Index access touches locked, memory-mapped files, so keep it off the event loop
+        match = await asyncio.to_thread(
+            self.similarity_service.find_company_analysis, company_url, company_text
+        )
+        if match is not None:
+            company_key, company_analysis = match
+        else:
+            company_key = company_url
+            company_analysis = await self.llm_service.analyze_company(company_data)
+            await asyncio.to_thread(
+                self.similarity_service.add_company_analysis,
+                company_url,
+                company_text,
+                company_analysis,
+            )
+
+        sales_strategy = await asyncio.to_thread(
+            self.similarity_service.find_sales_strategy,
+            company_key,
+            company_analysis,
+            product_data,
         )
+        if sales_strategy is None:
+            sales_strategy = await self.llm_service.generate_sales_strategy(
+                company_analysis, product_data
+            )
+            await asyncio.to_thread(
+                self.similarity_service.add_sales_strategy,
+                company_key,
+                company_analysis,
+                product_data,
+                sales_strategy,
+            )
 
         return Analysis(
             company_id=company.id,
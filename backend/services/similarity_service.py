@@ -0,0 +1,412 @@
+from typing import Dict, Any, List, Optional, Tuple
+import os
+import re
+import json
+import time
+import zlib
+import hashlib
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, single worker only
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{2,}")
+EMPTY_SLOT = -1
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _hash_key(key: str) -> int:
+    """Stable non-negative 63-bit hash used to identify keys and groups"""
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+class SimilarityIndex:
+    """
+    Local similarity index over hashed TF-IDF vectors.
+
+    Term frequencies are hashed into a fixed number of buckets and stored in
+    memory-mapped ``.npy`` files so every worker process shares the same pages.
+    Files live in a directory named after ``dim`` and ``capacity``, so changing
+    either starts a fresh index instead of resizing files other workers map.
+    Slot metadata (key, group, insertion time) lives in small arrays next to
+    the vectors, and each slot's payload in its own JSON file. A generation
+    counter lets each process keep its IDF-weighted, normalised matrix until
+    another write invalidates it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int = 4096,
+        capacity: int = 1024,
+    ):
+        self.path = os.path.join(path, f"d{dim}_c{capacity}")
+        self.dim = dim
+        self.capacity = capacity
+        self.payloads_path = os.path.join(self.path, "payloads")
+        self.lock_path = os.path.join(self.path, ".lock")
+
+        os.makedirs(self.payloads_path, exist_ok=True)
+        with self._locked():
+            self.vectors = self._open_memmap("vectors", (capacity, dim), np.float32)
+            self.df = self._open_memmap("df", (dim,), np.float32)
+            self.keys = self._open_memmap(
+                "keys", (capacity,), np.int64, fill=EMPTY_SLOT
+            )
+            self.groups = self._open_memmap("groups", (capacity,), np.int64)
+            self.added_at = self._open_memmap("added_at", (capacity,), np.float64)
+            self.generation = self._open_memmap("generation", (1,), np.int64)
+
+        self._cached_generation = None
+        self._cached_slots = np.empty(0, dtype=np.int64)
+        self._cached_matrix = np.empty((0, dim), dtype=np.float32)
+        self._cached_idf = np.ones(dim, dtype=np.float32)
+
+    def _open_memmap(
+        self, name: str, shape: Tuple[int, ...], dtype, fill: float = 0
+    ) -> np.memmap:
+        """
+        Open an existing array file, or create one filled with ``fill``.
+
+        Existing files are never truncated, since other workers may have them
+        mapped; a mismatched file is reported instead.
+        """
+        file_path = os.path.join(self.path, f"{name}.npy")
+        if not os.path.exists(file_path):
+            tmp_path = f"{file_path}.{os.getpid()}.tmp.npy"
+            array = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=dtype, shape=shape
+            )
+            array[:] = fill
+            array.flush()
+            del array
+            os.replace(tmp_path, file_path)
+
+        array = np.load(file_path, mmap_mode="r+")
+        if array.shape != shape or array.dtype != dtype:
+            raise ValueError(
+                f"Similarity index file {file_path} has shape {array.shape} "
+                f"and dtype {array.dtype}, expected {shape} and {np.dtype(dtype)}"
+            )
+        return array
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Hold a lock on the index across worker processes"""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _payload_path(self, slot: int) -> str:
+        return os.path.join(self.payloads_path, f"{slot}.json")
+
+    def _write_payload(self, slot: int, entry: Dict[str, Any]):
+        """Atomically replace one slot's payload file"""
+        tmp_path = f"{self._payload_path(slot)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._payload_path(slot))
+
+    def _read_payload(self, slot: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._payload_path(slot), "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Error reading similarity index slot {slot}: {str(e)}")
+            return None
+
+    def _bump_generation(self):
+        self.vectors.flush()
+        self.df.flush()
+        self.keys.flush()
+        self.groups.flush()
+        self.added_at.flush()
+        self.generation[0] += 1
+        self.generation.flush()
+
+    def vectorize(self, texts: List[str]) -> np.ndarray:
+        """Hash texts into sublinear term-frequency vectors"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            # crc32 is stable across processes, unlike the builtin hash()
+            buckets = np.fromiter(
+                (zlib.crc32(token.encode()) % self.dim for token in tokens),
+                dtype=np.int64,
+                count=len(tokens),
+            )
+            counts = np.bincount(buckets, minlength=self.dim).astype(np.float32)
+            np.log1p(counts, out=matrix[row])
+        return matrix
+
+    def _idf(self, doc_count: int) -> np.ndarray:
+        return np.log((1.0 + doc_count) / (1.0 + self.df)).astype(np.float32) + 1.0
+
+    def add(
+        self,
+        key: str,
+        text: str,
+        payload: Dict[str, Any],
+        group: str = "",
+        **metadata: Any,
+    ):
+        """
+        Add or replace an entry, evicting the oldest one when the index is full.
+
+        Extra keyword arguments are stored alongside the payload and returned
+        with query results.
+        """
+        vector = self.vectorize([text])[0]
+        key_hash = _hash_key(key)
+        with self._locked():
+            slot = self._find_slot(key_hash)
+            if self.keys[slot] != EMPTY_SLOT:
+                self.df -= self.vectors[slot] > 0
+            self.vectors[slot] = vector
+            self.df += vector > 0
+            self.keys[slot] = key_hash
+            self.groups[slot] = _hash_key(group)
+            self.added_at[slot] = time.time()
+            self._write_payload(
+                slot, {"key": key, "group": group, "payload": payload, **metadata}
+            )
+            self._bump_generation()
+
+    def _find_slot(self, key_hash: int) -> int:
+        """Return the slot holding key, else a free slot, else the oldest slot"""
+        matches = np.flatnonzero(self.keys == key_hash)
+        if matches.size:
+            return int(matches[0])
+        free = np.flatnonzero(self.keys == EMPTY_SLOT)
+        if free.size:
+            return int(free[0])
+        return int(np.argmin(self.added_at))
+
+    def evict(self, key: str) -> bool:
+        """Remove an entry by key"""
+        with self._locked():
+            matches = np.flatnonzero(self.keys == _hash_key(key))
+            if not matches.size:
+                return False
+            slot = int(matches[0])
+            self.df -= self.vectors[slot] > 0
+            self.vectors[slot] = 0.0
+            self.keys[slot] = EMPTY_SLOT
+            self.added_at[slot] = 0.0
+            try:
+                os.remove(self._payload_path(slot))
+            except OSError:
+                pass
+            self._bump_generation()
+            return True
+
+    def _weighted_matrix(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return occupied slots and their normalised TF-IDF rows, cached per generation"""
+        generation = int(self.generation[0])
+        if generation != self._cached_generation:
+            slots = np.flatnonzero(self.keys != EMPTY_SLOT)
+            idf = self._idf(len(slots))
+            matrix = self.vectors[slots] * idf
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            self._cached_slots = slots
+            self._cached_matrix = matrix
+            self._cached_idf = idf
+            self._cached_generation = generation
+        return self._cached_slots, self._cached_matrix
+
+    def query_batch(
+        self, texts: List[str], group: Optional[str] = None
+    ) -> List[Optional[Tuple[float, Dict[str, Any]]]]:
+        """
+        Return the nearest entry and its cosine similarity for each text.
+
+        When ``group`` is given only entries added with that group are considered.
+        """
+        if not texts:
+            return []
+        with self._locked(exclusive=False):
+            slots, matrix = self._weighted_matrix()
+            if group is not None:
+                mask = self.groups[slots] == _hash_key(group)
+                slots, matrix = slots[mask], matrix[mask]
+            if not slots.size:
+                return [None] * len(texts)
+
+            queries = self.vectorize(texts) * self._cached_idf
+            queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+            scores = queries @ matrix.T
+            best = scores.argmax(axis=1)
+
+            results = []
+            for row, col in enumerate(best):
+                entry = self._read_payload(int(slots[col]))
+                results.append(
+                    None if entry is None else (float(scores[row, col]), entry)
+                )
+            return results
+
+    def query(
+        self, text: str, group: Optional[str] = None
+    ) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """Return the nearest entry and its cosine similarity for a single text"""
+        return self.query_batch([text], group)[0]
+
+
+class SimilarityService:
+    """
+    Reuses prior company analyses and sales strategies for near-identical inputs.
+
+    Company analyses are matched on scraped page content. Sales strategies are
+    matched on product text, but only among strategies stored for the same
+    company analysis and price, so a strategy is never paired with a different
+    product or with an analysis other than the one it was built from.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("SIMILARITY_CACHE_ENABLED", "true").lower() == "true"
+        self.threshold = float(os.getenv("SIMILARITY_THRESHOLD", "0.92"))
+        self.cross_host_threshold = float(
+            os.getenv("SIMILARITY_CROSS_HOST_THRESHOLD", "0.98")
+        )
+        self.min_company_tokens = int(os.getenv("SIMILARITY_MIN_COMPANY_TOKENS", "20"))
+        self.min_product_tokens = int(os.getenv("SIMILARITY_MIN_PRODUCT_TOKENS", "3"))
+        path = os.getenv("SIMILARITY_INDEX_PATH", "similarity_index")
+        dim = int(os.getenv("SIMILARITY_INDEX_DIM", "4096"))
+        capacity = int(os.getenv("SIMILARITY_INDEX_CAPACITY", "1024"))
+        self.company_index: Optional[SimilarityIndex] = None
+        self.strategy_index: Optional[SimilarityIndex] = None
+        if self.enabled:
+            self.company_index = SimilarityIndex(
+                os.path.join(path, "company"), dim, capacity
+            )
+            self.strategy_index = SimilarityIndex(
+                os.path.join(path, "strategy"), dim, capacity
+            )
+
+    @staticmethod
+    def company_host(company_url: str) -> str:
+        host = urlparse(company_url).netloc.lower()
+        return host[4:] if host.startswith("www.") else host
+
+    def company_text(self, company_data: Dict[str, Any]) -> str:
+        """
+        Flatten scraped company info into a single text for vectorizing.
+
+        The host is deliberately left out so a match always rests on page content.
+        """
+        parts = [company_data.get("title", ""), company_data.get("description", "")]
+        parts.extend(str(v) for v in company_data.get("metadata", {}).values())
+        parts.extend(str(v) for v in company_data.get("company_details", {}).values())
+        return " ".join(part for part in parts if part)
+
+    def product_text(self, product_data: Dict[str, Any]) -> str:
+        """Combine the product fields the sales strategy depends on"""
+        return " ".join(
+            [
+                str(product_data.get("name", "")),
+                str(product_data.get("description", "")),
+                " ".join(product_data.get("features", [])),
+            ]
+        )
+
+    @staticmethod
+    def strategy_group(
+        company_key: str,
+        company_analysis: Dict[str, Any],
+        product_data: Dict[str, Any],
+    ) -> str:
+        """Group strategies by company, the exact analysis they used, and price"""
+        analysis_hash = hashlib.blake2b(
+            json.dumps(company_analysis, sort_keys=True).encode(), digest_size=8
+        ).hexdigest()
+        return f"{company_key}|{analysis_hash}|{product_data.get('price', '')}"
+
+    def find_company_analysis(
+        self, company_url: str, company_text: str
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Return the key and analysis of a near-identical company, if any
+        """
+        if not self.enabled or len(tokenize(company_text)) < self.min_company_tokens:
+            return None
+        match = self.company_index.query(company_text)
+        if match is None:
+            return None
+        score, entry = match
+        same_host = entry.get("host") == self.company_host(company_url)
+        if score < (self.threshold if same_host else self.cross_host_threshold):
+            return None
+        logger.info(f"Reusing company analysis of {entry['key']} ({score:.3f})")
+        return entry["key"], entry["payload"]
+
+    def add_company_analysis(
+        self, company_url: str, company_text: str, analysis: Dict[str, Any]
+    ):
+        if self.enabled and len(tokenize(company_text)) >= self.min_company_tokens:
+            self.company_index.add(
+                company_url,
+                company_text,
+                analysis,
+                host=self.company_host(company_url),
+            )
+
+    def find_sales_strategy(
+        self,
+        company_key: str,
+        company_analysis: Dict[str, Any],
+        product_data: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return a strategy built from the same company analysis and price whose
+        product text is near-identical, if any
+        """
+        product_text = self.product_text(product_data)
+        if not self.enabled or len(tokenize(product_text)) < self.min_product_tokens:
+            return None
+        match = self.strategy_index.query(
+            product_text,
+            group=self.strategy_group(company_key, company_analysis, product_data),
+        )
+        if match is None or match[0] < self.threshold:
+            return None
+        logger.info(f"Reusing sales strategy of {match[1]['key']} ({match[0]:.3f})")
+        return match[1]["payload"]
+
+    def add_sales_strategy(
+        self,
+        company_key: str,
+        company_analysis: Dict[str, Any],
+        product_data: Dict[str, Any],
+        strategy: Dict[str, Any],
+    ):
+        product_text = self.product_text(product_data)
+        if self.enabled and len(tokenize(product_text)) >= self.min_product_tokens:
+            group = self.strategy_group(company_key, company_analysis, product_data)
+            self.strategy_index.add(
+                f"{group}|{product_data.get('id', '')}",
+                product_text,
+                strategy,
+                group=group,
+            )
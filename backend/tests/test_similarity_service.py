@@ -0,0 +1,179 @@
+import os
+import numpy as np
+import pytest
+from services.similarity_service import SimilarityIndex, SimilarityService
+
+ROCKETS = "acme corp builds reusable rocket engines and launch vehicles for space"
+BAKERY = "family bakery selling fresh bread croissants and pastries in central paris"
+COMPANY_DATA = {
+    "title": "Acme Rockets - Reusable Launch Vehicles",
+    "description": (
+        "Acme builds reusable rocket engines, launch vehicles and satellite "
+        "deployment services for commercial and government customers worldwide."
+    ),
+    "metadata": {"site_name": "Acme Rockets"},
+    "company_details": {
+        "industry": "Aerospace industry leader in orbital launch and propulsion",
+        "founded_year": "2004",
+    },
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SimilarityIndex(str(tmp_path / "index"), dim=1024, capacity=3)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setenv("SIMILARITY_INDEX_PATH", str(tmp_path / "service"))
+    monkeypatch.setenv("SIMILARITY_INDEX_DIM", "1024")
+    monkeypatch.setenv("SIMILARITY_INDEX_CAPACITY", "8")
+    return SimilarityService()
+
+
+def test_add_then_query(index):
+    index.add("a", ROCKETS, {"id": 1})
+    index.add("b", BAKERY, {"id": 2})
+
+    score, entry = index.query(ROCKETS)
+    assert score == pytest.approx(1.0, abs=1e-5)
+    assert entry["key"] == "a"
+    assert entry["payload"] == {"id": 1}
+
+    results = index.query_batch([BAKERY, ROCKETS])
+    assert [entry["key"] for _, entry in results] == ["b", "a"]
+
+
+def test_query_empty_index(index):
+    assert index.query(ROCKETS) is None
+
+
+def test_add_replaces_existing_key(index):
+    index.add("a", ROCKETS, {"id": 1})
+    index.add("a", BAKERY, {"id": 2})
+
+    assert np.count_nonzero(index.keys != -1) == 1
+    score, entry = index.query(BAKERY)
+    assert score == pytest.approx(1.0, abs=1e-5)
+    assert entry["payload"] == {"id": 2}
+    np.testing.assert_array_equal(index.df, index.vectors[index.keys != -1][0] > 0)
+
+
+def test_evicts_oldest_at_capacity(tmp_path, index):
+    for key in ["a", "b", "c", "d"]:
+        index.add(key, f"{key}{key} {ROCKETS}", {"key": key})
+
+    reopened = SimilarityIndex(str(tmp_path / "index"), dim=1024, capacity=3)
+    stored = {reopened._read_payload(slot)["key"] for slot in range(3)}
+    assert stored == {"b", "c", "d"}
+
+
+def test_evict_updates_df(index):
+    index.add("a", ROCKETS, {"id": 1})
+    index.add("b", BAKERY, {"id": 2})
+
+    assert index.evict("a")
+    assert not index.evict("a")
+    np.testing.assert_array_equal(index.df, index.vectorize([BAKERY])[0] > 0)
+    _, entry = index.query(ROCKETS)
+    assert entry["key"] == "b"
+
+
+def test_query_sees_writes_from_other_instances(tmp_path, index):
+    index.query(ROCKETS)
+    other = SimilarityIndex(str(tmp_path / "index"), dim=1024, capacity=3)
+    other.add("a", ROCKETS, {"id": 1})
+
+    _, entry = index.query(ROCKETS)
+    assert entry["key"] == "a"
+
+
+def test_resized_index_uses_separate_files(tmp_path, index):
+    index.add("a", ROCKETS, {"id": 1})
+    resized = SimilarityIndex(str(tmp_path / "index"), dim=512, capacity=3)
+
+    assert resized.path != index.path
+    assert resized.query(ROCKETS) is None
+    assert index.query(ROCKETS)[1]["key"] == "a"
+
+
+def test_mismatched_file_is_not_truncated(index):
+    vectors_path = os.path.join(index.path, "vectors.npy")
+    np.save(vectors_path, np.zeros((2, 2), dtype=np.float32))
+
+    with pytest.raises(ValueError):
+        SimilarityIndex(os.path.dirname(index.path), dim=1024, capacity=3)
+    assert np.load(vectors_path).shape == (2, 2)
+
+
+def test_query_restricted_to_group(index):
+    index.add("a", ROCKETS, {"id": 1}, group="x")
+
+    assert index.query(ROCKETS, group="y") is None
+    assert index.query(ROCKETS, group="x")[1]["key"] == "a"
+
+
+def test_reuses_company_analysis_across_url_paths(service):
+    text = service.company_text(COMPANY_DATA)
+    service.add_company_analysis("https://www.acme.com/", text, {"id": 1})
+
+    key, analysis = service.find_company_analysis("https://acme.com/about", text)
+    assert key == "https://www.acme.com/"
+    assert analysis == {"id": 1}
+
+
+def test_thin_scrapes_are_not_reused(service):
+    text = service.company_text({})
+    service.add_company_analysis("https://x.com", text, {"id": 1})
+
+    assert service.find_company_analysis("https://y.com", text) is None
+    assert service.find_company_analysis("https://x.com", text) is None
+
+
+def test_cross_host_match_needs_stricter_threshold(service):
+    text = service.company_text(COMPANY_DATA)
+    service.add_company_analysis("https://acme.com", text, {"id": 1})
+    tweaked = f"{text} careers"
+
+    assert service.find_company_analysis("https://acme.com", tweaked) is not None
+    assert service.find_company_analysis("https://other.com", tweaked) is None
+
+
+def test_disabled_service_builds_no_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("SIMILARITY_CACHE_ENABLED", "false")
+    monkeypatch.setenv("SIMILARITY_INDEX_PATH", str(tmp_path / "disabled"))
+    service = SimilarityService()
+    text = service.company_text(COMPANY_DATA)
+    service.add_company_analysis("https://acme.com", text, {"id": 1})
+
+    assert service.company_index is None
+    assert service.find_company_analysis("https://acme.com", text) is None
+    assert not (tmp_path / "disabled").exists()
+
+
+def test_strategy_not_reused_for_different_product(service):
+    analysis = {"built_from": "rockets"}
+    crm = {"id": "1", "name": "CRM Pro", "description": "Customer relationship "
+           "management suite for sales teams", "price": 99, "features": []}
+    forklift = {"id": "2", "name": "Electric forklift", "description": "Battery "
+                "powered warehouse forklift", "price": 99, "features": []}
+    service.add_sales_strategy("https://acme.com", analysis, crm, {"id": "crm"})
+
+    find = service.find_sales_strategy
+    assert find("https://acme.com", analysis, crm) == {"id": "crm"}
+    assert find("https://acme.com", analysis, forklift) is None
+    assert find("https://other.com", analysis, crm) is None
+    assert find("https://acme.com", analysis, {**crm, "price": 199}) is None
+
+
+def test_strategy_not_reused_after_analysis_replaced(service):
+    crm = {"id": "1", "name": "CRM Pro", "description": "Customer relationship "
+           "management suite for sales teams", "price": 99, "features": []}
+    text = service.company_text(COMPANY_DATA)
+    rockets, coffee = {"built_from": "rockets"}, {"built_from": "coffee"}
+    service.add_company_analysis("https://acme.com", text, rockets)
+    service.add_sales_strategy("https://acme.com", rockets, crm, {"id": "crm"})
+    service.add_company_analysis("https://acme.com", text, coffee)
+
+    assert service.find_sales_strategy("https://acme.com", coffee, crm) is None